@@ -1,10 +1,18 @@
+import asyncio
 import os
-from typing import List, Dict, Set, Tuple, Optional
-from fastapi import FastAPI
+import sys
+from collections import deque
+from functools import lru_cache
+from typing import List, Dict, FrozenSet, Sequence, Set, Tuple, Optional
+import orjson
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
-app = FastAPI()
+from rules import Rule, FORWARD_RULES, BACKWARD_RULES, FAULT_PREFIX
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,116 +22,362 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ---------------------------
-# Knowledge Base (sample)
-# ---------------------------
-class Rule(BaseModel):
-    antecedents: List[str]
-    consequent: str
-    description: Optional[str] = None
-
-# Different rule sets for forward vs backward reasoning
-# Forward rules: broader, more permissive for exploratory hypothesis generation
-FORWARD_RULES: List[Rule] = [
-    Rule(antecedents=["battery_low"], consequent="power_unstable", description="Low battery can cause unstable power"),
-    Rule(antecedents=["power_unstable"], consequent="system_restarts", description="Unstable power can trigger restarts"),
-    Rule(antecedents=["no_wifi", "router_off"], consequent="network_down", description="No WiFi and router off implies network down"),
-    Rule(antecedents=["network_down"], consequent="cannot_sync", description="If the network is down, syncing fails"),
-    # Fault hypotheses (prefix fault_)
-    Rule(antecedents=["power_unstable"], consequent="fault_power_supply", description="Unstable power suggests power supply fault"),
-    Rule(antecedents=["battery_low", "charging_not_working"], consequent="fault_battery", description="Low battery + charging not working suggests battery fault"),
-    Rule(antecedents=["network_down"], consequent="fault_network", description="Network down suggests network fault"),
-]
-
-# Backward rules: stricter, require stronger evidence for a proof
-BACKWARD_RULES: List[Rule] = [
-    # Derivations for intermediate states
-    Rule(antecedents=["battery_low"], consequent="power_unstable", description="Low battery can cause unstable power"),
-    Rule(antecedents=["mains_fluctuation"], consequent="power_unstable", description="Mains fluctuation can cause unstable power"),
-    Rule(antecedents=["power_unstable"], consequent="system_restarts", description="Unstable power can trigger restarts"),
-    Rule(antecedents=["interference", "weak_signal"], consequent="no_wifi", description="Interference and weak signal cause Wi‑Fi loss"),
-    Rule(antecedents=["no_wifi", "router_off"], consequent="network_down", description="Router off with no Wi‑Fi implies network is down"),
-    Rule(antecedents=["network_down"], consequent="cannot_sync", description="No network means syncing fails"),
-    # Fault hypotheses (require stronger antecedents)
-    Rule(antecedents=["power_unstable", "system_restarts"], consequent="fault_power_supply", description="Unstable power AND restarts indicate power supply fault"),
-    Rule(antecedents=["battery_low", "charging_not_working", "old_battery"], consequent="fault_battery", description="Low, not charging, and aged battery indicates battery fault"),
-    Rule(antecedents=["no_wifi", "router_off", "cannot_sync"], consequent="fault_network", description="No Wi‑Fi, router off, and cannot sync indicates network fault"),
-]
-
-FAULT_PREFIX = "fault_"
+# Knowledge base lives in rules.py; everything below is the engine layer.
+# One JSON-shaped dict per rule, built once; trace and proof steps reference
+# these instead of allocating a fresh dict per derivation
+_RULE_DICTS: Dict[Rule, Dict] = {
+    r: {
+        "antecedents": list(r.antecedents),
+        "consequent": r.consequent,
+        "description": r.description,
+    }
+    for r in FORWARD_RULES + BACKWARD_RULES
+}
+
+
+def _rule_dict(r: Rule) -> Dict:
+    d = _RULE_DICTS.get(r)
+    if d is None:  # rule outside the module-level sets (ad-hoc callers)
+        d = {
+            "antecedents": list(r.antecedents),
+            "consequent": r.consequent,
+            "description": r.description,
+        }
+    return d
 
 # ---------------------------
 # Inference Engines
 # ---------------------------
 
-def forward_chain(facts: Set[str], rules: List[Rule]) -> Tuple[Set[str], List[Dict]]:
-    """Simple forward chaining for propositional Horn rules.
+def _build_bit_rule_index(rule_masks: List[int], n_literals: int) -> List[List[int]]:
+    """Index rules by antecedent bit for semi-naive forward chaining.
+    index[bit] lists the indices of rules whose antecedent mask sets bit.
+    """
+    index: List[List[int]] = [[] for _ in range(n_literals)]
+    for i, m in enumerate(rule_masks):
+        for bit in range(n_literals):
+            if m >> bit & 1:
+                index[bit].append(i)
+    return index
+
+
+def _assign_literal_ids(*rule_sets: Sequence[Rule]) -> Dict[str, int]:
+    """Assign each distinct literal in the given rule sets a bit position.
+    The vocabulary is tiny (well under 64 literals), so a fact set fits in a
+    single Python int and antecedent checks become one AND+compare.
+    """
+    literal_id: Dict[str, int] = {}
+    for rules in rule_sets:
+        for r in rules:
+            for a in r.antecedents:
+                literal_id.setdefault(a, len(literal_id))
+            literal_id.setdefault(r.consequent, len(literal_id))
+    return literal_id
+
+
+def _encode_rule_masks(rules: Sequence[Rule],
+                       literal_id: Dict[str, int]) -> Tuple[List[int], List[int]]:
+    """Per-rule bitmasks: (OR of antecedent bits, consequent bit)."""
+    masks = []
+    conseq_bits = []
+    for r in rules:
+        m = 0
+        for a in r.antecedents:
+            m |= 1 << literal_id[a]
+        masks.append(m)
+        conseq_bits.append(1 << literal_id[r.consequent])
+    return masks, conseq_bits
+
+
+def _build_rete(rules: Sequence[Rule]) -> Tuple[Dict[Tuple[int, str], int], Dict[int, List[int]]]:
+    """Compile rules into a RETE-style discrimination trie.
+    Each rule contributes a path of its antecedents (in canonical sorted
+    order so shared prefixes merge); nodes are integer ids, edges are
+    (parent_id, literal) keys, and emit maps the node completing a rule's
+    path to that rule's index. Node 0 is the root.
+    """
+    children: Dict[Tuple[int, str], int] = {}
+    emit: Dict[int, List[int]] = {}
+    next_id = 1
+    for i, r in enumerate(rules):
+        node = 0
+        for a in sorted(r.antecedents):
+            key = (node, a)
+            if key not in children:
+                children[key] = next_id
+                next_id += 1
+            node = children[key]
+        emit.setdefault(node, []).append(i)
+    return children, emit
+
+
+def _build_consequent_index(rules: Sequence[Rule]) -> Dict[str, List[Rule]]:
+    """Index rules by consequent so goal-directed lookups are O(1).
+    Candidates are ordered cheapest-first (fewest antecedents), so proof
+    search tries the rules most likely to close out quickly before the
+    expensive ones.
+    """
+    index: Dict[str, List[Rule]] = {}
+    for r in rules:
+        index.setdefault(r.consequent, []).append(r)
+    for candidates in index.values():
+        candidates.sort(key=lambda r: len(r.antecedents))
+    return index
+
+
+# Prebuilt indices and bit encodings for the module-level rule sets
+# (built once at import)
+BWD_CONSEQUENT_INDEX = _build_consequent_index(BACKWARD_RULES)
+LITERAL_ID = _assign_literal_ids(FORWARD_RULES, BACKWARD_RULES)
+FWD_RULE_MASKS, FWD_CONSEQ_BITS = _encode_rule_masks(FORWARD_RULES, LITERAL_ID)
+FWD_BIT_RULES = _build_bit_rule_index(FWD_RULE_MASKS, len(LITERAL_ID))
+FWD_RETE_CHILDREN, FWD_RETE_EMIT = _build_rete(FORWARD_RULES)
+# Opt-in RETE engine for /diagnose/forward; the bitmask kernel stays the
+# default since it wins at this rule-set size
+USE_RETE_ENGINE = os.getenv("FORWARD_ENGINE", "").lower() == "rete"
+# All fault bits derivable by the forward rules; once these are saturated a
+# fault-only query has nothing left to learn
+FWD_FAULT_MASK = 0
+for _r, _bit in zip(FORWARD_RULES, FWD_CONSEQ_BITS):
+    if _r.consequent.startswith(FAULT_PREFIX):
+        FWD_FAULT_MASK |= _bit
+
+# The rule sets never change at runtime, so serialize the /rules payload once
+_RULES_PAYLOAD = {
+    "forward_rules": [_rule_dict(r) for r in FORWARD_RULES],
+    "backward_rules": [_rule_dict(r) for r in BACKWARD_RULES],
+    "fault_prefix": FAULT_PREFIX,
+}
+_RULES_JSON = orjson.dumps(_RULES_PAYLOAD)
+
+
+def _fc_kernel(known_mask: int, rule_masks: List[int], conseq_bits: List[int],
+               bit_rules: List[List[int]], stop_mask: int = 0) -> Tuple[int, List[int]]:
+    """Pure-integer forward-chaining kernel.
+    Operates only on bitmasks and rule indices (no strings, no rule
+    objects): pop a newly-known bit off the agenda, AND-compare the masks of
+    the rules that mention it, and OR in the consequent bits of the rules
+    that fire. If stop_mask is non-zero, evaluation stops as soon as every
+    stop_mask bit is known -- callers that only care about those literals
+    can skip the remaining derivations. Returns the (possibly partially)
+    saturated mask and the fired rule indices in application order.
+    """
+    fired = []
+    agenda = deque(bit for bit in range(len(bit_rules)) if known_mask >> bit & 1)
+    while agenda:
+        bit = agenda.popleft()
+        for i in bit_rules[bit]:
+            if (known_mask & rule_masks[i]) == rule_masks[i] and not (known_mask & conseq_bits[i]):
+                known_mask |= conseq_bits[i]
+                fired.append(i)
+                if stop_mask and (known_mask & stop_mask) == stop_mask:
+                    return known_mask, fired
+                agenda.append(conseq_bits[i].bit_length() - 1)
+    return known_mask, fired
+
+
+def forward_chain(facts: Set[str], rules: Sequence[Rule],
+                  literal_id: Optional[Dict[str, int]] = None,
+                  rule_masks: Optional[List[int]] = None,
+                  conseq_bits: Optional[List[int]] = None,
+                  bit_rules: Optional[List[List[int]]] = None,
+                  stop_mask: int = 0) -> Tuple[Set[str], List[Dict]]:
+    """Semi-naive forward chaining for propositional Horn rules.
+    Known facts are packed into an integer bitmask, so the "all antecedents
+    satisfied" check for a rule is a single AND+compare instead of a
+    per-antecedent set lookup. The fixed-point computation itself runs in
+    _fc_kernel on integers only; this wrapper handles the string<->bit
+    translation and assembles the trace from the fired rule indices.
     Returns (all_derived_facts, trace)
     trace: list of {rule, new_fact} applied in order
     """
+    if literal_id is None or rule_masks is None or conseq_bits is None:
+        literal_id = _assign_literal_ids(rules)
+        rule_masks, conseq_bits = _encode_rule_masks(rules, literal_id)
+    if bit_rules is None:
+        bit_rules = _build_bit_rule_index(rule_masks, len(literal_id))
+
+    known_mask = 0
+    for f in facts:
+        bit = literal_id.get(f)
+        if bit is not None:  # facts outside the rule vocabulary can't fire anything
+            known_mask |= 1 << bit
+
+    known_mask, fired = _fc_kernel(known_mask, rule_masks, conseq_bits, bit_rules, stop_mask)
+
+    trace = [_rule_dict(rules[i]) for i in fired]
+
+    # Convert back to a string set only when assembling the result
+    known = set(facts)
+    for literal, bit in literal_id.items():
+        if known_mask >> bit & 1:
+            known.add(literal)
+    return known, trace
+
+
+def forward_chain_rete(facts: Set[str], rules: Sequence[Rule],
+                       children: Optional[Dict[Tuple[int, str], int]] = None,
+                       emit: Optional[Dict[int, List[int]]] = None) -> Tuple[Set[str], List[Dict]]:
+    """Forward chaining over a RETE-style discrimination trie.
+    Instead of re-testing a rule's full antecedent list whenever one of its
+    antecedents fires, partial matches are kept as a set of active trie
+    nodes: a new fact only advances the nodes that have an edge for it, and
+    a rule fires when the node completing its path activates. Trades memory
+    for incremental matching; pays off as the rule set grows.
+    Same contract as forward_chain: returns (all_derived_facts, trace).
+    """
+    if children is None or emit is None:
+        children, emit = _build_rete(rules)
+
     known = set(facts)
     trace = []
-    applied = True
-    while applied:
-        applied = False
-        for r in rules:
-            # If all antecedents are known and consequent not yet known, derive it
-            if all(a in known for a in r.antecedents) and r.consequent not in known:
-                known.add(r.consequent)
-                trace.append({
-                    "antecedents": r.antecedents,
-                    "consequent": r.consequent,
-                    "description": r.description,
-                })
-                applied = True
+    active = {0}
+    fact_queue = deque(known)
+    while fact_queue:
+        f = fact_queue.popleft()
+        node_stack = []
+        for n in list(active):
+            c = children.get((n, f))
+            if c is not None and c not in active:
+                active.add(c)
+                node_stack.append(c)
+        while node_stack:
+            n = node_stack.pop()
+            # Rules whose antecedent path completes at this node fire now
+            for i in emit.get(n, ()):
+                r = rules[i]
+                if r.consequent not in known:
+                    known.add(r.consequent)
+                    trace.append(_rule_dict(r))
+                    fact_queue.append(r.consequent)
+            # A node activated late must catch up on facts already known
+            for f2 in known:
+                c = children.get((n, f2))
+                if c is not None and c not in active:
+                    active.add(c)
+                    node_stack.append(c)
     return known, trace
 
 
-def backward_chain(goal: str, facts: Set[str], rules: List[Rule],
-                   visited: Optional[Set[str]] = None) -> Tuple[bool, List[Dict]]:
-    """Depth-first backward chaining to prove goal from facts using rules.
+def backward_chain(goal: str, facts: Set[str], rules: Dict[str, List[Rule]],
+                   memo: Optional[Dict[str, Tuple[bool, List[Dict]]]] = None) -> Tuple[bool, List[Dict]]:
+    """Backward chaining to prove goal from facts, as an iterative AND-OR
+    graph search over an explicit stack instead of Python recursion.
+    Each stack frame is an OR node for one goal (iterating its candidate
+    rules); the rule currently being tried is the AND node (iterating its
+    antecedents). Cycles are detected as membership in the set of goals on
+    the current stack path. rules is a consequent->rules index (see
+    _build_consequent_index). Results are memoized per call so subgoals
+    reached via multiple paths are only computed once; a failure reached
+    after hitting a cycle may be a path artifact rather than a real
+    refutation, so only cycle-free failures are cached.
     Returns (provable, proof_steps)
     proof_steps is a list with entries describing how goals were satisfied.
     """
-    if visited is None:
-        visited = set()
-
-    # If goal is already a known fact
-    if goal in facts:
-        return True, [{"goal": goal, "type": "given"}]
-
-    if goal in visited:
-        return False, [{"goal": goal, "type": "cycle"}]
-
-    visited.add(goal)
-
-    # Consider rules that conclude the goal
-    candidate_rules = [r for r in rules if r.consequent == goal]
-    for r in candidate_rules:
-        subproof = []
-        all_ok = True
-        for subgoal in r.antecedents:
-            ok, proof = backward_chain(subgoal, facts, rules, visited)
-            subproof.extend(proof)
-            if not ok:
-                all_ok = False
-                break
-        if all_ok:
-            # Entire rule satisfied
-            step = {
-                "goal": goal,
-                "type": "inferred",
-                "using": {
-                    "antecedents": r.antecedents,
-                    "consequent": r.consequent,
-                    "description": r.description,
-                },
-                "subproof": subproof,
-            }
-            return True, [step]
-
-    # If no rule can prove it and it's not a given fact
-    return False, [{"goal": goal, "type": "not-provable"}]
+    if memo is None:
+        memo = {}
+
+    path: Set[str] = set()  # goals on the current stack, for cycle detection
+    stack: List[Dict] = []
+    cycles = [0]
+
+    def _resolve(g: str) -> Optional[Tuple[bool, List[Dict]]]:
+        """Immediate answer for a goal, or None if it needs expansion."""
+        if g in memo:
+            return memo[g]
+        if g in facts:
+            return True, [{"goal": g, "type": "given"}]
+        if g in path:
+            cycles[0] += 1
+            return False, [{"goal": g, "type": "cycle"}]
+        # Necessary-step check: a rule whose antecedents are all given facts
+        # yields a minimal proof, so no alternative needs exploring
+        for r in rules.get(g, ()):
+            if all(a in facts for a in r.antecedents):
+                step = {
+                    "goal": g,
+                    "type": "inferred",
+                    "using": _rule_dict(r),
+                    "subproof": [{"goal": a, "type": "given"} for a in r.antecedents],
+                }
+                memo[g] = (True, [step])
+                return memo[g]
+        return None
+
+    def _push(g: str) -> None:
+        path.add(g)
+        stack.append({
+            "goal": g,
+            "rules": iter(rules.get(g, ())),
+            "rule": None,            # AND node currently being tried
+            "antecedents": iter(()),
+            "subproof": [],
+            "cycles_at_entry": cycles[0],
+        })
+
+    result = _resolve(goal)
+    if result is None:
+        _push(goal)
+
+    while stack:
+        frame = stack[-1]
+        if result is not None:
+            # A subgoal of the current rule just finished
+            ok, proof = result
+            result = None
+            if ok:
+                frame["subproof"].extend(proof)
+            else:
+                frame["rule"] = None  # abandon this rule, backtrack to the next
+        if frame["rule"] is not None:
+            subgoal = next(frame["antecedents"], None)
+            if subgoal is None:
+                # Every antecedent proved: the goal is inferred
+                r = frame["rule"]
+                step = {
+                    "goal": frame["goal"],
+                    "type": "inferred",
+                    "using": _rule_dict(r),
+                    "subproof": frame["subproof"],
+                }
+                result = (True, [step])
+                memo[frame["goal"]] = result
+                path.discard(frame["goal"])
+                stack.pop()
+                continue
+            sub = _resolve(subgoal)
+            if sub is not None:
+                result = sub
+            else:
+                _push(subgoal)
+            continue
+        # Move on to the next candidate rule for this goal
+        r = next(frame["rules"], None)
+        if r is None:
+            # No rule can prove it and it's not a given fact
+            result = (False, [{"goal": frame["goal"], "type": "not-provable"}])
+            if cycles[0] == frame["cycles_at_entry"]:
+                memo[frame["goal"]] = result
+            path.discard(frame["goal"])
+            stack.pop()
+            continue
+        frame["rule"] = r
+        frame["antecedents"] = iter(r.antecedents)
+        frame["subproof"] = []
+
+    return result
+
+
+@lru_cache(maxsize=1024)
+def _backward_cached(facts_fs: FrozenSet[str], goal: str) -> Tuple[bool, bytes]:
+    """Run backward_chain against the module-level rules, cached per
+    (facts, goal) pair so repeated queries from the UI do zero inference.
+    The proof is cached as orjson bytes -- an immutable value that callers
+    thaw into a fresh structure, so cache entries can never be mutated
+    through a returned reference.
+    """
+    provable, proof = backward_chain(goal, facts_fs, BWD_CONSEQUENT_INDEX, memo={})
+    return provable, orjson.dumps(proof)
 
 
 # ---------------------------
@@ -136,37 +390,52 @@ class BackwardRequest(BaseModel):
     facts: List[str]
     goal: str
 
+class BatchBackwardRequest(BaseModel):
+    facts: List[str]
+    goals: List[str]
+
 # ---------------------------
 # Routes
 # ---------------------------
+# Constant GET payloads, serialized once -- these routes see high-frequency
+# health-check traffic and have nothing to compute per request
+_ROOT_JSON = orjson.dumps({"message": "Symbolic Fault Diagnosis API"})
+_HELLO_JSON = orjson.dumps({"message": "Hello from the backend API!"})
+_TEST_JSON = orjson.dumps({
+    "backend": "✅ Running",
+    "database": "ℹ️ Not used for this activity",
+})
+
 @app.get("/")
 def read_root():
-    return {"message": "Symbolic Fault Diagnosis API"}
+    return Response(content=_ROOT_JSON, media_type="application/json")
 
 @app.get("/api/hello")
 def hello():
-    return {"message": "Hello from the backend API!"}
+    return Response(content=_HELLO_JSON, media_type="application/json")
 
 @app.get("/test")
 def test_database():
     """Simple health endpoint for this activity (database optional)."""
-    return {
-        "backend": "✅ Running",
-        "database": "ℹ️ Not used for this activity",
-    }
+    return Response(content=_TEST_JSON, media_type="application/json")
 
 @app.get("/rules")
 def get_rules():
-    return {
-        "forward_rules": [r.model_dump() for r in FORWARD_RULES],
-        "backward_rules": [r.model_dump() for r in BACKWARD_RULES],
-        "fault_prefix": FAULT_PREFIX,
-    }
+    return Response(content=_RULES_JSON, media_type="application/json")
 
 @app.post("/diagnose/forward")
-def diagnose_forward(req: FactsRequest):
-    input_facts = set(a.strip() for a in req.facts if a and a.strip())
-    all_facts, trace = forward_chain(input_facts, FORWARD_RULES)
+def diagnose_forward(req: FactsRequest, fault_only: bool = False):
+    input_facts = {sys.intern(s) for s in (a.strip() for a in req.facts) if s}
+    if USE_RETE_ENGINE:
+        all_facts, trace = forward_chain_rete(input_facts, FORWARD_RULES,
+                                              FWD_RETE_CHILDREN, FWD_RETE_EMIT)
+    else:
+        # With fault_only the caller just wants the fault hypotheses, so stop
+        # chaining once every fault consequent is saturated
+        stop_mask = FWD_FAULT_MASK if fault_only else 0
+        all_facts, trace = forward_chain(input_facts, FORWARD_RULES, LITERAL_ID,
+                                         FWD_RULE_MASKS, FWD_CONSEQ_BITS, FWD_BIT_RULES,
+                                         stop_mask)
     faults = sorted([f for f in all_facts if f.startswith(FAULT_PREFIX)])
     return {
         "input_facts": sorted(list(input_facts)),
@@ -177,9 +446,18 @@ def diagnose_forward(req: FactsRequest):
 
 @app.post("/diagnose/backward")
 def diagnose_backward(req: BackwardRequest):
-    input_facts = set(a.strip() for a in req.facts if a and a.strip())
+    input_facts = {sys.intern(s) for s in (a.strip() for a in req.facts) if s}
     goal = req.goal.strip()
-    provable, proof = backward_chain(goal, input_facts, BACKWARD_RULES)
+    if not goal:
+        # Nothing to prove; skip the inference engine entirely
+        return {
+            "goal": goal,
+            "facts": sorted(list(input_facts)),
+            "provable": False,
+            "proof": [],
+        }
+    provable, proof_bytes = _backward_cached(frozenset(input_facts), goal)
+    proof = orjson.loads(proof_bytes)
     return {
         "goal": goal,
         "facts": sorted(list(input_facts)),
@@ -187,6 +465,29 @@ def diagnose_backward(req: BackwardRequest):
         "proof": proof,
     }
 
+@app.post("/diagnose/backward/batch")
+async def diagnose_backward_batch(req: BatchBackwardRequest):
+    """Prove several goals against one fact set in a single round trip.
+    Goals run concurrently instead of as sequential HTTP calls; repeat
+    (facts, goal) pairs are served straight from the backward cache.
+    """
+    input_facts = {sys.intern(s) for s in (a.strip() for a in req.facts) if s}
+    facts_fs = frozenset(input_facts)
+    goals = [g.strip() for g in req.goals]
+    tasks = [asyncio.to_thread(_backward_cached, facts_fs, g) for g in goals if g]
+    done = iter(await asyncio.gather(*tasks))
+    results = []
+    for g in goals:
+        if not g:
+            results.append({"goal": g, "provable": False, "proof": []})
+            continue
+        provable, proof_bytes = next(done)
+        results.append({"goal": g, "provable": provable, "proof": orjson.loads(proof_bytes)})
+    return {
+        "facts": sorted(list(input_facts)),
+        "results": results,
+    }
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
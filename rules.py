@@ -0,0 +1,65 @@
+"""
+Knowledge Base
+
+The propositional Horn rules used by the fault-diagnosis endpoints.
+Kept separate from the inference engines in main.py so the Rule type and
+the rule data are defined (and normalized) exactly once.
+"""
+
+import sys
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+
+class Rule(NamedTuple):
+    """A propositional Horn rule. The rule sets are hand-authored constants,
+    so a plain immutable tuple suffices -- no Pydantic validation machinery
+    or per-request model_dump needed.
+    """
+    antecedents: Tuple[str, ...]
+    consequent: str
+    description: Optional[str] = None
+
+# Different rule sets for forward vs backward reasoning
+# Forward rules: broader, more permissive for exploratory hypothesis generation
+FORWARD_RULES: Sequence[Rule] = [
+    Rule(antecedents=["battery_low"], consequent="power_unstable", description="Low battery can cause unstable power"),
+    Rule(antecedents=["power_unstable"], consequent="system_restarts", description="Unstable power can trigger restarts"),
+    Rule(antecedents=["no_wifi", "router_off"], consequent="network_down", description="No WiFi and router off implies network down"),
+    Rule(antecedents=["network_down"], consequent="cannot_sync", description="If the network is down, syncing fails"),
+    # Fault hypotheses (prefix fault_)
+    Rule(antecedents=["power_unstable"], consequent="fault_power_supply", description="Unstable power suggests power supply fault"),
+    Rule(antecedents=["battery_low", "charging_not_working"], consequent="fault_battery", description="Low battery + charging not working suggests battery fault"),
+    Rule(antecedents=["network_down"], consequent="fault_network", description="Network down suggests network fault"),
+]
+
+# Backward rules: stricter, require stronger evidence for a proof
+BACKWARD_RULES: Sequence[Rule] = [
+    # Derivations for intermediate states
+    Rule(antecedents=["battery_low"], consequent="power_unstable", description="Low battery can cause unstable power"),
+    Rule(antecedents=["mains_fluctuation"], consequent="power_unstable", description="Mains fluctuation can cause unstable power"),
+    Rule(antecedents=["power_unstable"], consequent="system_restarts", description="Unstable power can trigger restarts"),
+    Rule(antecedents=["interference", "weak_signal"], consequent="no_wifi", description="Interference and weak signal cause Wi‑Fi loss"),
+    Rule(antecedents=["no_wifi", "router_off"], consequent="network_down", description="Router off with no Wi‑Fi implies network is down"),
+    Rule(antecedents=["network_down"], consequent="cannot_sync", description="No network means syncing fails"),
+    # Fault hypotheses (require stronger antecedents)
+    Rule(antecedents=["power_unstable", "system_restarts"], consequent="fault_power_supply", description="Unstable power AND restarts indicate power supply fault"),
+    Rule(antecedents=["battery_low", "charging_not_working", "old_battery"], consequent="fault_battery", description="Low, not charging, and aged battery indicates battery fault"),
+    Rule(antecedents=["no_wifi", "router_off", "cannot_sync"], consequent="fault_network", description="No Wi‑Fi, router off, and cannot sync indicates network fault"),
+]
+
+FAULT_PREFIX = "fault_"
+
+def _normalize_rules(rules: Sequence[Rule]) -> Tuple[Rule, ...]:
+    """Freeze each rule's antecedents into a tuple and intern every literal
+    so the set/dict lookups in the inference engines can short-circuit on
+    pointer identity instead of comparing characters.
+    """
+    return tuple(
+        Rule(tuple(sys.intern(a) for a in r.antecedents),
+             sys.intern(r.consequent), r.description)
+        for r in rules
+    )
+
+
+FORWARD_RULES = _normalize_rules(FORWARD_RULES)
+BACKWARD_RULES = _normalize_rules(BACKWARD_RULES)